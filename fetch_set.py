@@ -6,8 +6,14 @@ Reads configuration from config.txt in the same folder as this script.
 
 import sys
 import os
+import re
+import json
 import time
 import logging
+import threading
+from enum import Enum
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from functools import partial
 from pathlib import Path
 
 # Determine script/executable directory for both Python and PyInstaller
@@ -31,6 +37,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Auto-install missing dependencies
+# Pillow-SIMD can be installed in place of Pillow for faster image resizing; it imports as PIL too
 required_packages = {
     "requests": "requests",
     "PIL": "Pillow",
@@ -45,15 +52,24 @@ for module_name, package_name in required_packages.items():
         subprocess.check_call([sys.executable, "-m", "pip", "install", package_name])
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from PIL import Image
 from io import BytesIO
 
+# Optional faster JSON parser for Scryfall responses
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
 
 def load_config():
     """
     Load configuration from config.txt in the same directory as the script.
     Works with both regular Python and PyInstaller-compiled executables.
-    Returns tuple: (output_file, set_codes_list, download_images)
+    Returns tuple: (output_file, set_codes_list, download_images, download_workers, refresh_images, use_bulk_data)
+    Set codes are returned in lowercase, which is what every other function expects.
     """
     config_file = script_dir / "config.txt"
     
@@ -61,11 +77,14 @@ def load_config():
     output_file = "custom.txt"
     set_codes = []
     download_images = False
+    download_workers = 12
+    refresh_images = False
+    use_bulk_data = False
     
     if not config_file.exists():
         logger.warning(f"config.txt not found at {config_file}")
         logger.warning("Using default values: output_file=custom.txt, set_codes=[], download_images=False")
-        return output_file, set_codes, download_images
+        return output_file, set_codes, download_images, download_workers, refresh_images, use_bulk_data
     
     try:
         with open(config_file, "r", encoding="utf-8") as f:
@@ -85,20 +104,81 @@ def load_config():
                 if key == "output_file":
                     output_file = value
                 elif key == "set_codes":
-                    # Parse comma-separated set codes
-                    set_codes = [code.strip() for code in value.split(",") if code.strip()]
+                    # Parse comma-separated set codes, normalized to lowercase once here
+                    set_codes = [code.strip().lower() for code in value.split(",") if code.strip()]
                 elif key == "download_images":
                     download_images = value.lower() in ("true", "yes", "1")
+                elif key == "download_workers":
+                    try:
+                        download_workers = max(1, int(value))
+                    except ValueError:
+                        logger.warning(f"Invalid download_workers value '{value}', using {download_workers}")
+                elif key == "refresh_images":
+                    refresh_images = value.lower() in ("true", "yes", "1")
+                elif key == "use_bulk_data":
+                    use_bulk_data = value.lower() in ("true", "yes", "1")
     except Exception as e:
         logger.error(f"Error reading config.txt: {e}")
         logger.warning("Using default values")
-        return "custom.txt", [], False
+        return "custom.txt", [], False, 12, False, False
     
-    return output_file, set_codes, download_images
+    return output_file, set_codes, download_images, download_workers, refresh_images, use_bulk_data
 
 
 # Global variables loaded from config
-OUTPUT_FILE, SET_CODES, DOWNLOAD_IMAGES = load_config()
+# DOWNLOAD_WORKERS is the number of card images downloaded in parallel.
+# Images are served from cards.scryfall.io, which is not subject to the API rate limit.
+# REFRESH_IMAGES revalidates already downloaded images instead of skipping them.
+# USE_BULK_DATA reads all sets from Scryfall's bulk data file instead of searching each set.
+OUTPUT_FILE, SET_CODES, DOWNLOAD_IMAGES, DOWNLOAD_WORKERS, REFRESH_IMAGES, USE_BULK_DATA = load_config()
+
+# Layouts Scryfall's card search leaves out unless include_extras is set
+EXTRAS_LAYOUTS = {"token", "double_faced_token", "emblem", "art_series", "planar", "scheme", "vanguard"}
+
+# Image directories already created during this run (see ensure_dir)
+_CREATED_DIRS = set()
+
+# Shared HTTP session so all Scryfall requests reuse pooled keep-alive connections
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=max(32, DOWNLOAD_WORKERS),
+    # Retry rate limiting (429) and transient server errors with exponential backoff,
+    # honoring Retry-After; urllib3 logs each retry at DEBUG level
+    max_retries=Retry(
+        total=5,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"],
+        respect_retry_after_header=True,
+    ),
+))
+# Scryfall asks every client to send a User-Agent and an Accept header
+SESSION.headers.update({
+    "User-Agent": "MagicPlugin/1.0",
+    "Accept": "application/json;q=0.9,*/*;q=0.8",
+})
+
+# WUBRG color bits, and the color string for each of the 32 possible combinations
+_COLOR_BITS = {"W": 1, "U": 2, "B": 4, "R": 8, "G": 16}
+_COLOR_STRINGS = ["".join(c for i, c in enumerate("WUBRG") if mask & (1 << i)) for mask in range(32)]
+
+# A single mana symbol, e.g. {2}, {W} or {W/U}
+_MANA_SYMBOL_RE = re.compile(r'\{[^}]*\}')
+
+# Scryfall asks for 50-100ms between API requests (images on cards.scryfall.io are exempt)
+API_REQUEST_INTERVAL = 0.1
+_api_request_lock = threading.Lock()
+_last_api_request = 0.0
+
+# Reminder text in parentheses, removed from oracle text
+_REMINDER_RE = re.compile(r'\s*\([^)]*\)\s*')
+
+# Collector number tokens: digit runs or single other characters
+_COLLECTOR_TOKEN_RE = re.compile(r'(\d+)|(\D)')
+
+# Card types that have their own sound (creature is checked first)
+_SOUND_TYPES_RE = re.compile(r'artifact|instant|enchantment|sorcery|land')
 
 
 def convert_mana_cost(cost_string):
@@ -109,18 +189,10 @@ def convert_mana_cost(cost_string):
     if not cost_string:
         return ""
     # Scryfall already uses the format we need, just uppercase the letters
-    result = ""
-    i = 0
-    while i < len(cost_string):
-        if cost_string[i] == "{":
-            # Find closing bracket
-            end = cost_string.index("}", i)
-            mana_part = cost_string[i:end+1]
-            result += mana_part.upper()
-            i = end + 1
-        else:
-            i += 1
-    return result
+    if " " not in cost_string:
+        return cost_string.upper()
+    # Split card costs join the halves with " // ", which is dropped
+    return "".join(_MANA_SYMBOL_RE.findall(cost_string)).upper()
 
 
 def get_color_string(colors):
@@ -130,45 +202,19 @@ def get_color_string(colors):
     """
     if not colors:
         return ""
-    # WUBRG order
-    order = {"W": 0, "U": 1, "B": 2, "R": 3, "G": 4}
-    sorted_colors = sorted(colors, key=lambda x: order.get(x, 5))
-    return "".join(sorted_colors)
-
-
-def get_color_id(colors):
-    """
-    Convert color array to WUBRG string.
-    ["W", "U"] -> "WU" (or in WUBRG order)
-    """
-    if not colors:
-        return ""
-    # WUBRG order
-    order = {"W": 0, "U": 1, "B": 2, "R": 3, "G": 4}
-    sorted_colors = sorted(colors, key=lambda x: order.get(x, 5))
-    return "".join(sorted_colors)
+    # Collect colors into a bitmask, then read it back in WUBRG order
+    mask = 0
+    for color in colors:
+        mask |= _COLOR_BITS.get(color, 0)
+    return _COLOR_STRINGS[mask]
 
 
-def get_script(card, set_code):
+def get_script(other_face_name, set_code):
     """
-    Get script for the card.
-    For double-faced cards, creates a script to spawn the other side.
+    Get script for the front face of a double-faced card, spawning the other side.
     Format: <s><l>Create other side</l><f>/spawn [set_code] Other Face Name</f></s>
     """
-    if "card_faces" not in card or len(card["card_faces"]) < 2:
-        return ""
-    
-    # Get the names of both faces
-    face_names = [face.get("name", "") for face in card["card_faces"]]
-    
-    # Determine which face is current (we format the first face)
-    # The script should spawn the second face
-    if len(face_names) >= 2:
-        other_face_name = face_names[1]
-        script = f"<s><l>Create other side</l><f>/spawn [{set_code}] {other_face_name}</f></s>"
-        return script
-    
-    return ""
+    return f"<s><l>Create other side</l><f>/spawn [{set_code}] {other_face_name}</f></s>"
 
 
 def get_sound(type_line):
@@ -177,66 +223,80 @@ def get_sound(type_line):
     Creature takes priority - if a card is a creature, it always gets creature sound.
     For non-creatures, only sets sound if there is exactly one clear type.
     Returns the type name if found, empty string if unclear or multiple types.
+    Only the types before the "—" are considered, never the subtypes.
     """
     if not type_line:
         return ""
     
-    type_line_lower = type_line.lower()
+    # Subtypes such as "Island" would otherwise match "land"
+    type_line_lower = type_line.partition("—")[0].lower()
     
     # Creature takes priority
     if "creature" in type_line_lower:
         return "creature"
     
-    sound_types = ["artifact", "instant", "enchantment", "sorcery", "land"]
-    
     # Find which types match
-    matched_types = []
-    for sound_type in sound_types:
-        if sound_type in type_line_lower:
-            matched_types.append(sound_type)
+    matched_types = set(_SOUND_TYPES_RE.findall(type_line_lower))
     
     # Only set sound if exactly one type matched
     if len(matched_types) == 1:
-        return matched_types[0]
+        return matched_types.pop()
     
     return ""
 
 
-def fetch_set_cards(set_code):
+def throttle_api_request():
+    """
+    Wait until API_REQUEST_INTERVAL has passed since the previous Scryfall API request.
+    Only sleeps when requests actually come in faster than that.
+    """
+    global _last_api_request
+    with _api_request_lock:
+        wait = _last_api_request + API_REQUEST_INTERVAL - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        _last_api_request = time.monotonic()
+
+
+def fetch_set_cards(set_code, on_page=None):
     """
     Fetch all cards from a specific set using Scryfall API.
     Uses unique=prints to get all versions with different collector numbers.
+    If given, on_page is called with each page's cards as soon as it arrives.
     """
     logger.info(f"Fetching cards for set: {set_code}")
     
-    url = f"https://api.scryfall.com/cards/search"
+    url = "https://api.scryfall.com/cards/search"
     params = {
         "q": f"set:{set_code}",
         "unique": "prints"
     }
     
     all_cards = []
-    has_more = True
     page = 1
     
-    while has_more:
+    while url:
         logger.info(f"  Fetching page {page}...")
         try:
-            response = requests.get(url, params=params, timeout=30)
+            throttle_api_request()
+            response = SESSION.get(url, params=params, timeout=30)
             response.raise_for_status()
-            data = response.json()
+            data = json_loads(response.content)
             
             page_cards = data.get("data", [])
             all_cards.extend(page_cards)
             logger.info(f"  Got {len(page_cards)} cards (total: {len(all_cards)})")
             
+            if on_page:
+                on_page(page_cards)
+            
+            # Follow Scryfall's next_page URL, which already carries the query
             if data.get("has_more"):
-                params["page"] = page + 1
+                url = data.get("next_page")
+                params = None
                 page += 1
-                # Rate limit: 100ms delay between requests (10 requests per second)
-                time.sleep(0.1)
             else:
-                has_more = False
+                url = None
         except requests.exceptions.Timeout:
             logger.error("  ERROR: Request timed out!")
             raise
@@ -248,151 +308,206 @@ def fetch_set_cards(set_code):
     return all_cards
 
 
-def format_card(card, set_code):
+def fetch_bulk_cards(set_codes):
     """
-    Format a single card for Lackey CCG output.
-    For double-faced cards, appends 'a' to collector number for front face.
+    Fetch all cards for the given sets from Scryfall's "default-cards" bulk data file.
+    The file is downloaded once to sets/bulk/ and reused until Scryfall publishes a new one.
+    Extras and variations are dropped so the cards match what fetch_set_cards returns.
+    Needs the ijson package (pip install ijson); raises ImportError without it.
+    Returns dict: set_code (lowercase) -> list of cards
     """
-    name = card.get("name", "")
-    collector_number = card.get("collector_number", "")
+    import ijson
     
-    # For double-faced cards, append 'a' to the front face image file
-    is_double_faced = "card_faces" in card and len(card["card_faces"]) >= 2
-    if is_double_faced:
-        image_file = f"{set_code}/{collector_number}a"
-        # For double-faced cards, get attributes from the first face
-        front_face = card["card_faces"][0]
-        colors = front_face.get("colors", [])
-        cost = convert_mana_cost(front_face.get("mana_cost", ""))
-        type_line = front_face.get("type_line", "")
-        power = front_face.get("power", "")
-        toughness = front_face.get("toughness", "")
-        loyalty = front_face.get("loyalty", "")
-        oracle_text = front_face.get("oracle_text", "")
-    else:
-        image_file = f"{set_code}/{collector_number}"
-        # For single-faced cards, get attributes from card root
-        colors = card.get("colors", [])
-        cost = convert_mana_cost(card.get("mana_cost", ""))
-        type_line = card.get("type_line", "")
-        power = card.get("power", "")
-        toughness = card.get("toughness", "")
-        loyalty = card.get("loyalty", "")
-        oracle_text = card.get("oracle_text", "")
-    
-    color_string = get_color_string(colors)
-    color_id = get_color_id(colors)
+    logger.info("Fetching Scryfall bulk data (default-cards)...")
     
-    mana_value = card.get("cmc", 0)
+    throttle_api_request()
+    response = SESSION.get("https://api.scryfall.com/bulk-data/default-cards", timeout=30)
+    response.raise_for_status()
+    download_uri = json_loads(response.content)["download_uri"]
     
-    rarity = card.get("rarity", "").upper()[0] if card.get("rarity") else ""
+    # The download URI contains the publish timestamp, so its filename identifies the version
+    bulk_dir = Path("sets/bulk")
+    bulk_dir.mkdir(parents=True, exist_ok=True)
+    bulk_file = bulk_dir / download_uri.rsplit("/", 1)[-1]
     
-    # Remove reminder text in parentheses
-    import re
-    oracle_text = re.sub(r'\s*\([^)]*\)\s*', ' ', oracle_text).strip()
-    oracle_text = oracle_text.replace("\n", " | ")
+    if bulk_file.exists():
+        logger.info(f"  Using cached {bulk_file}")
+    else:
+        logger.info(f"  Downloading {download_uri}...")
+        tmp_file = bulk_file.with_suffix(".tmp")
+        try:
+            with SESSION.get(download_uri, stream=True, timeout=30) as r:
+                r.raise_for_status()
+                with open(tmp_file, "wb") as f:
+                    for chunk in r.iter_content(chunk_size=1 << 20):
+                        f.write(chunk)
+        except BaseException:
+            # Don't leave a partial download behind (e.g. disk full or Ctrl-C)
+            tmp_file.unlink(missing_ok=True)
+            raise
+        os.replace(tmp_file, bulk_file)
+        
+        # Remove older versions of the bulk file
+        for old_file in bulk_dir.glob("*.json"):
+            if old_file != bulk_file:
+                old_file.unlink()
     
-    sound = get_sound(type_line)
-    script = get_script(card, set_code)
+    wanted = set(set_codes)
+    cards_by_set = {code: [] for code in wanted}
     
-    # Format: Name, Set, ImageFile, ActualSet, Color, ColorID, Cost, ManaValue, Type, Power, Toughness, Loyalty, Rarity, DraftQualities, Sound, Script, Text
-    fields = [
-        name,
-        set_code,
-        image_file,
-        set_code,
-        color_string,
-        color_id,
-        cost,
-        str(int(mana_value)),
-        type_line,
-        power,
-        toughness,
-        loyalty,
-        rarity,
-        "",  # DraftQualities
-        sound,  # Sound
-        script,  # Script
-        oracle_text
-    ]
+    # Stream the JSON array so the whole file is never held in memory
+    try:
+        with open(bulk_file, "rb") as f:
+            for card in ijson.items(f, "item", use_float=True):
+                card_set = card.get("set")
+                if card_set not in wanted:
+                    continue
+                # Card search excludes these by default (include_extras/include_variations)
+                if card.get("variation") or card.get("layout") in EXTRAS_LAYOUTS:
+                    continue
+                cards_by_set[card_set].append(card)
+    except (ijson.JSONError, ValueError) as e:
+        # Truncated or corrupt file; remove it so the next run downloads it again
+        logger.warning(f"  Removing unreadable {bulk_file}")
+        bulk_file.unlink(missing_ok=True)
+        raise ValueError(f"Unreadable bulk data file {bulk_file}: {e}") from e
+    
+    for code in sorted(wanted):
+        logger.info(f"  {code}: {len(cards_by_set[code])} cards")
     
-    return "\t".join(fields)
+    return cards_by_set
 
 
-def format_back_card(card, set_code):
+def clean_oracle_text(oracle_text):
     """
-    Format the back side of a double-faced card.
-    Name is prefixed with [set_code].
-    Image file uses collector_numberb.
+    Remove reminder text in parentheses and join lines with " | ".
+    "Flying\nDraw a card. (Reminder.)" -> "Flying | Draw a card."
     """
-    if "card_faces" not in card or len(card["card_faces"]) < 2:
-        return None
-    
-    back_face = card["card_faces"][1]
-    collector_number = card.get("collector_number", "")
-    
-    # Name with set code prefix
-    back_name = f"[{set_code}] {back_face.get('name', '')}"
-    image_file = f"{set_code}/{collector_number}b"
-    
-    # Get colors from back face
-    colors = back_face.get("colors", [])
-    color_string = get_color_string(colors)
-    color_id = get_color_id(colors)
+    if not oracle_text:
+        return ""
+    return _REMINDER_RE.sub(' ', oracle_text).strip().replace("\n", " | ")
+
+
+def format_face_line(card, face, name, image_file, set_code, script):
+    """
+    Format one Lackey CCG line.
+    face supplies colors, cost, type, stats and text (it is the card itself for single-faced cards);
+    card supplies mana value and rarity, which are shared by both sides.
+    """
+    # Color and ColorID are the same WUBRG string, so compute it once
+    color_string = get_color_string(face.get("colors", []))
+    color_id = color_string
     
-    # Back face might have different mana cost
-    cost = convert_mana_cost(back_face.get("mana_cost", ""))
+    cost = convert_mana_cost(face.get("mana_cost", ""))
     
     # Use original card's mana value (cmc is same for both sides)
     mana_value = card.get("cmc", 0)
     
-    type_line = back_face.get("type_line", "")
+    type_line = face.get("type_line", "")
     
-    power = back_face.get("power", "")
-    toughness = back_face.get("toughness", "")
-    loyalty = back_face.get("loyalty", "")
+    power = face.get("power", "")
+    toughness = face.get("toughness", "")
+    loyalty = face.get("loyalty", "")
     
     rarity = card.get("rarity", "").upper()[0] if card.get("rarity") else ""
     
-    # Get oracle text from back face
-    oracle_text = back_face.get("oracle_text", "")
-    import re
-    oracle_text = re.sub(r'\s*\([^)]*\)\s*', ' ', oracle_text).strip()
-    oracle_text = oracle_text.replace("\n", " | ")
+    oracle_text = clean_oracle_text(face.get("oracle_text", ""))
     
     sound = get_sound(type_line)
     
-    # Back side doesn't have script (no need to spawn another side)
-    script = ""
-    
     # Format: Name, Set, ImageFile, ActualSet, Color, ColorID, Cost, ManaValue, Type, Power, Toughness, Loyalty, Rarity, DraftQualities, Sound, Script, Text
-    fields = [
-        back_name,
-        set_code,
-        image_file,
-        set_code,
-        color_string,
-        color_id,
-        cost,
-        str(int(mana_value)),
-        type_line,
-        power,
-        toughness,
-        loyalty,
-        rarity,
-        "",  # DraftQualities
-        sound,  # Sound
-        script,  # Script
-        oracle_text
+    # DraftQualities is always empty
+    return (
+        f"{name}\t{set_code}\t{image_file}\t{set_code}\t{color_string}\t{color_id}\t{cost}\t{int(mana_value)}\t"
+        f"{type_line}\t{power}\t{toughness}\t{loyalty}\t{rarity}\t\t{sound}\t{script}\t{oracle_text}"
+    )
+
+
+def format_card_sides(card, set_code):
+    """
+    Format a card for Lackey CCG output, returning one line per side.
+    Single-faced cards give one line using the collector number as image file.
+    Double-faced cards give the front face (collector_numbera, with a script to
+    spawn the other side) and the back face (collector_numberb, name prefixed
+    with [set_code]).
+    """
+    collector_number = card.get("collector_number", "")
+    faces = card.get("card_faces")
+    
+    if not faces or len(faces) < 2:
+        return [format_face_line(card, card, card.get("name", ""), f"{set_code}/{collector_number}", set_code, "")]
+    
+    front_face, back_face = faces[0], faces[1]
+    back_name = back_face.get("name", "")
+    return [
+        format_face_line(card, front_face, card.get("name", ""), f"{set_code}/{collector_number}a",
+                         set_code, get_script(back_name, set_code)),
+        # Back side doesn't have script (no need to spawn another side)
+        format_face_line(card, back_face, f"[{set_code}] {back_name}", f"{set_code}/{collector_number}b",
+                         set_code, ""),
     ]
+
+
+def collector_number_sort_key(card):
+    """
+    Sort key for numerically aware collector number ordering.
+    "1", "10", "2" -> 1, 2, 10
+    Digit runs compare as numbers, other characters one by one.
+    """
+    col_num = card.get("collector_number", "0")
+    return tuple((0, int(digits)) if digits else (1, char) for digits, char in _COLLECTOR_TOKEN_RE.findall(col_num))
+
+
+def read_output_file(output_file):
+    """
+    Read an existing output file.
+    Returns tuple: (header, blank_lines, card_lines) where card_lines maps
+    (card name, image_file) to the card's line, in file order.
+    """
+    card_lines = {}
+    blank_lines = []
+    
+    with open(output_file, "r", encoding="utf-8") as f:
+        header = f.readline()
+        
+        # Blank lines between the header and the card data are kept as-is
+        line = f.readline()
+        while line and line.strip() == "":
+            blank_lines.append(line)
+            line = f.readline()
+        
+        while line:
+            # The last line may lack a newline if the file was edited by hand
+            if not line.endswith("\n"):
+                line += "\n"
+            add_card_line(card_lines, line)
+            line = f.readline()
     
-    return "\t".join(fields)
+    return header, blank_lines, card_lines
+
+
+def add_card_line(card_lines, line):
+    """
+    Add an output line to card_lines, replacing any earlier line for the same card.
+    Matches on: card name + image_file (which contains set_code/collector_number).
+    The replacement moves to the end, where the latest entry was written.
+    """
+    # Only the first three fields are needed for the key
+    parts = line.split('\t', 3)
+    if len(parts) >= 3:
+        key = (parts[0], parts[2])
+        card_lines.pop(key, None)
+        card_lines[key] = line
 
 
 def write_set_file(set_code, cards):
     """
     Write formatted cards to the output file specified in config.txt.
-    Appends cards from all sets to the same file.
+    Cards from all sets share the same file. Lines already in the file for the
+    same card are replaced, so the file never holds duplicates.
+    The file is written to a temporary file first and then swapped in, so an
+    interrupted run never leaves a half-written output file.
+    Note: cards is sorted in place by collector number.
     Returns tuple: (output_file, was_newly_created)
     """
     output_dir = Path("sets")
@@ -400,46 +515,33 @@ def write_set_file(set_code, cards):
     
     output_file = output_dir / OUTPUT_FILE
     
-    # Check if file exists
-    file_exists = output_file.exists()
-    
-    # Sort cards by collector number (numerically aware)
-    def sort_key(card):
-        col_num = card.get("collector_number", "0")
-        # Handle numeric sorting: "1", "10", "2" -> 1, 2, 10
-        parts = []
-        current = ""
-        for char in col_num:
-            if char.isdigit():
-                current += char
-            else:
-                if current:
-                    parts.append((0, int(current)))
-                    current = ""
-                parts.append((1, char))
-        if current:
-            parts.append((0, int(current)))
-        return parts
-    
-    cards = sorted(cards, key=sort_key)
-    
-    with open(output_file, "a" if file_exists else "w", encoding="utf-8") as f:
-        # Write header and blank lines only if creating new file
-        if not file_exists:
-            header = "Name\tSet\tImageFile\tActualSet\tColor\tColorID\tCost\tManaValue\tType\tPower\tToughness\tLoyalty\tRarity\tDraftQualities\tSound\tScript\tText"
-            f.write(header + "\n")
-            f.write("\n\n")
-        
-        # Write cards
-        for card in cards:
-            f.write(format_card(card, set_code.lower()) + "\n")
-            # Also write back side of double-faced cards
-            back_card = format_back_card(card, set_code.lower())
-            if back_card:
-                f.write(back_card + "\n")
+    # Check if file exists (an empty file is treated as new)
+    file_exists = output_file.exists() and output_file.stat().st_size > 0
     
     if file_exists:
-        logger.info(f"Appended {len(cards)} cards to {output_file}")
+        header, blank_lines, card_lines = read_output_file(output_file)
+    else:
+        header = "Name\tSet\tImageFile\tActualSet\tColor\tColorID\tCost\tManaValue\tType\tPower\tToughness\tLoyalty\tRarity\tDraftQualities\tSound\tScript\tText\n"
+        blank_lines = ["\n", "\n"]
+        card_lines = {}
+    
+    # Sort cards by collector number (numerically aware), in place to avoid copying the list
+    cards.sort(key=collector_number_sort_key)
+    
+    for card in cards:
+        # Double-faced cards also get a line for their back side
+        for line in format_card_sides(card, set_code):
+            add_card_line(card_lines, line + "\n")
+    
+    tmp_file = output_file.with_name(output_file.name + ".tmp")
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        f.write(header)
+        f.writelines(blank_lines)
+        f.write("".join(card_lines.values()))
+    os.replace(tmp_file, output_file)
+    
+    if file_exists:
+        logger.info(f"Added {len(cards)} cards to {output_file}")
     else:
         logger.info(f"Created {output_file} with {len(cards)} cards")
     
@@ -452,7 +554,7 @@ def update_list_file(set_code):
     """
     list_file = Path("ListOfCardDataFiles.txt")
     
-    set_filename = f"{set_code.lower()}.txt"
+    set_filename = f"{set_code}.txt"
     
     with open(list_file, "r", encoding="utf-8") as f:
         content = f.read()
@@ -474,56 +576,6 @@ def update_list_file(set_code):
         logger.info(f"Updated ListOfCardDataFiles.txt to include {set_filename}")
 
 
-def deduplicate_output_file(output_file):
-    """
-    Deduplicate lines in the output file, keeping the latest entries.
-    Matches on: card name + set code + collector number.
-    Preserves header (first line) and blank lines, deduplicates card data.
-    """
-    with open(output_file, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-    
-    if not lines:
-        return
-    
-    # Preserve header
-    header = lines[0]
-    
-    # Find where the actual card data starts (after blank lines)
-    data_start = 1
-    blank_lines = []
-    while data_start < len(lines) and lines[data_start].strip() == "":
-        blank_lines.append(lines[data_start])
-        data_start += 1
-    
-    # Deduplicate card data, keeping latest entries
-    # Match on: card name + image_file (which contains set_code/collector_number)
-    seen_keys = set()
-    unique_cards = []
-    for line in reversed(lines[data_start:]):
-        parts = line.rstrip('\n').split('\t')
-        if len(parts) >= 3:
-            name = parts[0]
-            image_file = parts[2]  # format: "set_code/collector_number"
-            # Create key from name and image_file
-            key = (name, image_file)
-            
-            if key not in seen_keys:
-                seen_keys.add(key)
-                unique_cards.append(line)
-    
-    # Reverse back to original order
-    unique_cards.reverse()
-    
-    # Write back
-    with open(output_file, "w", encoding="utf-8") as f:
-        f.write(header)
-        f.writelines(blank_lines)
-        f.writelines(unique_cards)
-    
-    logger.info(f"Deduplicated {output_file}")
-
-
 def get_image_url(card):
     """
     Get the image URL for a card.
@@ -545,126 +597,237 @@ def get_image_url(card):
     return None
 
 
-def download_card_image(card, set_code, base_path):
+def fetch_image_bytes(image_url, etag=None):
     """
-    Download a single card image.
-    For double-faced cards, downloads both sides with 'a' and 'b' suffixes.
-    Returns True if successful, False otherwise.
+    Download the raw (still compressed) bytes of a card image.
+    If etag is given the request is conditional (If-None-Match).
+    Returns tuple: (image_data, etag) where image_data is None if the image is unchanged.
     """
-    collector_number = card.get("collector_number", "")
+    headers = {"If-None-Match": etag} if etag else None
+    response = SESSION.get(image_url, headers=headers, timeout=30)
+    if response.status_code == 304:
+        return None, etag
+    response.raise_for_status()
+    return response.content, response.headers.get("ETag")
+
+
+def resize_and_save_image(image_data, file_path):
+    """
+    Resize a downloaded card image to 312x445 and save it as JPEG.
+    Pillow releases the GIL while decoding, resampling and encoding,
+    so this runs in parallel across the download threads.
+    """
+    image = Image.open(BytesIO(image_data))
+    # Let libjpeg decode large sources at a reduced scale (never below the target size)
+    image.draft("RGB", (312, 445))
+    # For sources more than 3x the target (e.g. non-JPEG images), box-reduce first, then Lanczos
+    image = image.resize((312, 445), Image.Resampling.LANCZOS, reducing_gap=3.0)
+    image.save(file_path, "JPEG")
+
+
+def download_image_file(image_url, file_path, etags):
+    """
+    Download and resize one image to file_path unless it is already there.
+    With refresh_images enabled, existing files are revalidated using the ETag
+    stored in etags and only rewritten when the image changed on Scryfall.
+    etags maps "<dir>/<file>" to the ETag of the last downloaded image.
+    """
+    etag_key = f"{file_path.parent.name}/{file_path.name}"
+    etag = None
     
-    # Determine if this is a token
-    type_line = card.get("type_line", "").lower()
-    is_token = "token" in type_line
+    # Skip if already exists
+    if file_path.exists():
+        if not REFRESH_IMAGES:
+            return
+        etag = etags.get(etag_key)
     
-    # Create directory structure: setimages/setcode/setcode/ or setimages/setcode/tsetcode/
-    set_base = base_path / set_code.lower()
-    if is_token:
-        set_dir = set_base / f"t{set_code.lower()}"
-    else:
-        set_dir = set_base / set_code.lower()
-    
-    set_dir.mkdir(parents=True, exist_ok=True)
+    image_data, new_etag = fetch_image_bytes(image_url, etag)
+    if image_data is not None:
+        resize_and_save_image(image_data, file_path)
+    if new_etag:
+        etags[etag_key] = new_etag
+
+
+def ensure_dir(path):
+    """
+    Create a directory (and parents) once; later calls for the same path skip the syscall.
+    """
+    if path not in _CREATED_DIRS:
+        path.mkdir(parents=True, exist_ok=True)
+        _CREATED_DIRS.add(path)
+
+
+def image_etags_file(set_code):
+    """
+    Path of the file holding the ETags of a set's downloaded images.
+    """
+    return Path("sets/setimages") / set_code / "etags.json"
+
+
+def load_image_etags(etags_file):
+    """
+    Load the ETags recorded for a set's downloaded images.
+    """
+    if not etags_file.exists():
+        return {}
+    try:
+        with open(etags_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable {etags_file}: {e}")
+        return {}
+
+
+class DownloadStatus(Enum):
+    """
+    Outcome of downloading a card's image(s).
+    """
+    OK = "ok"
+    FAILED = "failed"
+    SKIPPED = "skipped"  # Card has no image to download
+
+
+def card_image_files(card):
+    """
+    List the images to download for a card as (image_url, filename) pairs.
+    Double-faced cards get one entry per face with 'a', 'b', ... suffixes.
+    Split, flip and adventure cards have faces but a single card-level image,
+    which is used for every face.
+    image_url is None when the card (or face) has no image.
+    """
+    collector_number = card.get("collector_number", "")
     
     # Check if this is a double-faced card
     is_double_faced = "card_faces" in card and len(card["card_faces"]) >= 2
     
     if is_double_faced:
-        # Download both faces
-        success = True
+        card_image_uris = card.get("image_uris", {})
+        files = []
         for i, face in enumerate(card["card_faces"]):
             suffix = chr(97 + i)  # 'a', 'b', 'c', etc.
-            image_uris = face.get("image_uris", {})
+            image_uris = face.get("image_uris") or card_image_uris
             # Prefer border_crop version: border_crop > large > normal > small
             image_url = image_uris.get("border_crop") or image_uris.get("large") or image_uris.get("normal") or image_uris.get("small")
-            
-            if not image_url:
-                success = False
-                continue
-            
-            file_path = set_dir / f"{collector_number}{suffix}.jpg"
-            
-            # Skip if already exists
-            if file_path.exists():
-                continue
-            
-            try:
-                response = requests.get(image_url, timeout=30)
-                response.raise_for_status()
-                
-                # Download and resize image
-                image = Image.open(BytesIO(response.content))
-                image = image.resize((312, 445), Image.Resampling.LANCZOS)
-                image.save(file_path, "JPEG")
-            except requests.exceptions.RequestException:
-                success = False
-            except Exception:
-                success = False
-        
-        return success
-    else:
-        # Single-faced card
-        image_url = get_image_url(card)
-        
+            files.append((image_url, f"{collector_number}{suffix}.jpg"))
+        return files
+    
+    # Single-faced card
+    return [(get_image_url(card), f"{collector_number}.jpg")]
+
+
+def download_card_image(card, set_dir, etags):
+    """
+    Download a single card image into set_dir, which must already exist.
+    For double-faced cards, downloads both sides with 'a' and 'b' suffixes.
+    Returns a DownloadStatus.
+    """
+    success = True
+    has_image = False
+    
+    for image_url, filename in card_image_files(card):
         if not image_url:
-            return False
-        
-        # Build file path
-        file_path = set_dir / f"{collector_number}.jpg"
-        
-        # Skip if already exists
-        if file_path.exists():
-            return True
+            success = False
+            continue
+        has_image = True
         
         # Download and resize image
         try:
-            response = requests.get(image_url, timeout=30)
-            response.raise_for_status()
-            
-            image = Image.open(BytesIO(response.content))
-            image = image.resize((312, 445), Image.Resampling.LANCZOS)
-            image.save(file_path, "JPEG")
-            
-            return True
-            
+            download_image_file(image_url, set_dir / filename, etags)
         except requests.exceptions.RequestException:
-            return False
+            success = False
+        except Exception:
+            success = False
+    
+    if success:
+        return DownloadStatus.OK
+    return DownloadStatus.FAILED if has_image else DownloadStatus.SKIPPED
+
+
+def submit_image_downloads(executor, set_code, cards, etags, futures, existing_files):
+    """
+    Queue image downloads for cards on the executor.
+    Can be called several times per set, e.g. once per fetched page.
+    futures maps each submitted future to its card.
+    existing_files caches the file names already in each image directory, so a
+    directory is listed once per set instead of checking every file separately.
+    """
+    # Directory structure: setimages/setcode/setcode/ or setimages/setcode/tsetcode/ for tokens
+    set_base = Path("sets/setimages") / set_code
+    card_dir = set_base / set_code
+    token_dir = set_base / f"t{set_code}"
+    
+    for card in cards:
+        # Determine if this is a token
+        is_token = "token" in card.get("type_line", "").lower()
+        set_dir = token_dir if is_token else card_dir
+        # Directories are created here, before the workers need them (at most two per set)
+        ensure_dir(set_dir)
+        
+        if set_dir not in existing_files:
+            existing_files[set_dir] = {entry.name for entry in os.scandir(set_dir)}
+        existing = existing_files[set_dir]
+        
+        # Cards whose images are all present need no worker at all
+        if not REFRESH_IMAGES and all(
+            image_url and filename in existing for image_url, filename in card_image_files(card)
+        ):
+            future = Future()
+            future.set_result(DownloadStatus.OK)
+        else:
+            future = executor.submit(download_card_image, card, set_dir, etags)
+        futures[future] = card
 
 
-def download_set_images(set_code, cards):
+def collect_image_downloads(set_code, futures, etags):
     """
-    Download all images for a set from already-fetched cards.
+    Wait for a set's queued image downloads, save their ETags and log a summary.
     """
-    base_path = Path("sets/setimages")
-    
-    print(f"\nDownloading images for {len(cards)} cards...")
+    print(f"\nDownloading images for {len(futures)} cards...")
     
     successful = 0
     failed = 0
     skipped = 0
     
-    for i, card in enumerate(cards, 1):
+    total = len(futures)
+    for i, future in enumerate(as_completed(futures), 1):
+        card = futures[future]
         card_name = card.get("name", "Unknown")
-        logger.info(f"[{i}/{len(cards)}] {card_name}")
+        status = future.result()
         
-        if download_card_image(card, set_code, base_path):
+        # Per-card lines only at DEBUG level; failures and periodic progress are always shown
+        logger.debug(f"[{i}/{total}] {card_name}: {status.value}")
+        if status is DownloadStatus.OK:
             successful += 1
+        elif status is DownloadStatus.SKIPPED:
+            skipped += 1
         else:
-            # Check if it was skipped (no image) or failed
-            if get_image_url(card) is None:
-                skipped += 1
-            else:
-                failed += 1
+            failed += 1
+            logger.warning(f"[{i}/{total}] Failed to download image for {card_name}")
         
-        # Rate limit: 100ms delay between image downloads
-        if i < len(cards):
-            time.sleep(0.1)
+        if i % 50 == 0 or i == total:
+            logger.info(f"  {i}/{total} cards done")
+    
+    if etags:
+        etags_file = image_etags_file(set_code)
+        etags_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(etags_file, "w", encoding="utf-8") as f:
+            json.dump(etags, f, indent=1, sort_keys=True)
     
     logger.info(f"\n=== Image Download Summary ===")
     logger.info(f"Successful: {successful}")
     logger.info(f"Failed: {failed}")
     logger.info(f"Skipped (no image): {skipped}")
-    logger.info(f"Images saved to: sets/setimages/{set_code.lower()}/")
+    logger.info(f"Images saved to: sets/setimages/{set_code}/")
+
+
+def cancel_image_downloads(futures):
+    """
+    Cancel a set's queued image downloads that have not started yet.
+    Used when the set fails, so its downloads don't keep running unattended.
+    """
+    cancelled = sum(1 for future in futures if future.cancel())
+    if cancelled:
+        logger.info(f"  Cancelled {cancelled} pending image downloads")
 
 
 def main():
@@ -682,45 +845,74 @@ def main():
     
     logger.info(f"Fetching {len(SET_CODES)} set(s): {', '.join(SET_CODES)}")
     logger.info(f"Output file: sets/{OUTPUT_FILE}")
-    logger.info(f"Download images: {DOWNLOAD_IMAGES}\n")
+    logger.info(f"Download images: {DOWNLOAD_IMAGES} ({DOWNLOAD_WORKERS} parallel downloads)\n")
     
     successful_sets = 0
     failed_sets = 0
     
-    for i, set_code in enumerate(SET_CODES, 1):
-        logger.info(f"[{i}/{len(SET_CODES)}] Processing {set_code}...")
-        logger.info("=" * 50)
-        
+    # Bulk data is opt-in: the file is large, and only pays off when fetching many sets
+    bulk_cards = None
+    if USE_BULK_DATA:
         try:
-            cards = fetch_set_cards(set_code)
-            if not cards:
-                logger.warning(f"No cards found for set: {set_code}")
+            bulk_cards = fetch_bulk_cards(SET_CODES)
+        except ImportError:
+            logger.warning("use_bulk_data needs the ijson package (pip install ijson), falling back to per-set search")
+        except (requests.exceptions.RequestException, KeyError, ValueError, OSError) as e:
+            logger.warning(f"Could not read bulk data, falling back to per-set search: {e}")
+    
+    # Image downloads run in the background while pages are fetched and the file is written
+    image_executor = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS)
+    try:
+        for i, set_code in enumerate(SET_CODES, 1):
+            logger.info(f"[{i}/{len(SET_CODES)}] Processing {set_code}...")
+            logger.info("=" * 50)
+            
+            image_futures = {}
+            try:
+                queue_images = None
+                if DOWNLOAD_IMAGES:
+                    etags = load_image_etags(image_etags_file(set_code))
+                    queue_images = partial(submit_image_downloads, image_executor, set_code,
+                                           etags=etags, futures=image_futures, existing_files={})
+                
+                if bulk_cards is not None:
+                    cards = bulk_cards[set_code]
+                    if queue_images:
+                        queue_images(cards)
+                else:
+                    cards = fetch_set_cards(set_code, on_page=queue_images)
+                if not cards:
+                    logger.warning(f"No cards found for set: {set_code}")
+                    failed_sets += 1
+                    continue
+                
+                output_file, was_newly_created = write_set_file(set_code, cards)
+                
+                # Only update list file if we created a new file
+                if was_newly_created:
+                    update_list_file(set_code)
+                
+                if DOWNLOAD_IMAGES:
+                    collect_image_downloads(set_code, image_futures, etags)
+                
+                logger.info(f"✓ Completed {set_code}!")
+                successful_sets += 1
+                
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Error fetching from Scryfall for {set_code}: {e}")
+                cancel_image_downloads(image_futures)
                 failed_sets += 1
                 continue
-            
-            output_file, was_newly_created = write_set_file(set_code, cards)
-            
-            # Deduplicate the output file
-            deduplicate_output_file(output_file)
-            
-            # Only update list file if we created a new file
-            if was_newly_created:
-                update_list_file(set_code)
-            
-            if DOWNLOAD_IMAGES:
-                download_set_images(set_code, cards)
-            
-            logger.info(f"✓ Completed {set_code}!")
-            successful_sets += 1
-            
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error fetching from Scryfall for {set_code}: {e}")
-            failed_sets += 1
-            continue
-        except Exception as e:
-            logger.error(f"Error processing {set_code}: {e}", exc_info=True)
-            failed_sets += 1
-            continue
+            except Exception as e:
+                logger.error(f"Error processing {set_code}: {e}", exc_info=True)
+                cancel_image_downloads(image_futures)
+                failed_sets += 1
+                continue
+    except BaseException:
+        # On Ctrl-C or an unexpected error, drop queued downloads instead of draining them
+        image_executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    image_executor.shutdown()
     
     logger.info("=" * 60)
     logger.info("All sets processed!")